@@ -1,151 +1,405 @@
-import os
-from dotenv import load_dotenv
-import re
-from pathlib import Path
-from typing import List
-
-from openai import OpenAI
-
-load_dotenv()
-
-ARTIFACTS_DIR = Path("artifacts")
-TRANSCRIPT_PATH = ARTIFACTS_DIR / "transcript.txt"
-OUT_SUMMARY_PATH = ARTIFACTS_DIR / "summary.md"
-
-# Keep chunks small enough to be safe across models
-MAX_CHARS_PER_CHUNK = 12_000  # ~2k-3k tokens depending on text
-
-
-def read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8", errors="ignore")
-
-
-def split_into_chunks(text: str, max_chars: int = MAX_CHARS_PER_CHUNK) -> List[str]:
-    """
-    Splits transcript into chunks close to max_chars, preferring to split on blank lines.
-    If no blank lines, splits on sentence-ish boundaries.
-    """
-    text = text.strip()
-    if not text:
-        return []
-
-    # First try splitting by lines, since your transcript is line-based.
-    lines = text.splitlines()
-    chunks = []
-    buf = []
-
-    cur_len = 0
-    for line in lines:
-        line_len = len(line) + 1
-        if cur_len + line_len > max_chars and buf:
-            chunks.append("\n".join(buf).strip())
-            buf = []
-            cur_len = 0
-        buf.append(line)
-        cur_len += line_len
-
-    if buf:
-        chunks.append("\n".join(buf).strip())
-
-    # Fallback: if something is still too large, hard split
-    final = []
-    for ch in chunks:
-        if len(ch) <= max_chars:
-            final.append(ch)
-        else:
-            # hard split by character count
-            for i in range(0, len(ch), max_chars):
-                final.append(ch[i : i + max_chars])
-    return final
-
-
-def clean_timestamps(transcript_chunk: str) -> str:
-    """
-    Optional: remove [MM:SS - MM:SS] so the model focuses on content.
-    """
-    return re.sub(r"\[\d{2}:\d{2}(?::\d{2})?\s*-\s*\d{2}:\d{2}(?::\d{2})?\]\s*", "", transcript_chunk)
-
-
-def summarize_chunk(client: OpenAI, chunk_text: str, idx: int, total: int) -> str:
-    prompt = f"""
-You are summarizing a transcript chunk ({idx}/{total}).
-Write:
-1) 6-10 bullet key points
-2) important names/terms (if any)
-3) any decisions, steps, or concrete takeaways
-Be faithful to the transcript. If uncertain, say so.
-"""
-
-    resp = client.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {
-                "role": "system",
-                "content": "You produce concise, accurate summaries of transcripts.",
-            },
-            {
-                "role": "user",
-                "content": prompt + "\n\nTRANSCRIPT CHUNK:\n" + chunk_text,
-            },
-        ],
-    )
-    return resp.output_text.strip()
-
-
-def combine_summaries(client: OpenAI, chunk_summaries: List[str]) -> str:
-    joined = "\n\n".join(
-        [f"### Chunk {i+1}\n{txt}" for i, txt in enumerate(chunk_summaries)]
-    )
-
-    prompt = """
-You are given summaries of transcript chunks.
-Produce a final structured summary in markdown with:
-
-## Overview (3-5 sentences)
-## Key points (8-12 bullets)
-## Notable details (optional)
-## Action items / next steps (if any)
-## Open questions (if any)
-
-Avoid repeating the same point. Keep it crisp.
-If the content is mostly narrative, focus on themes and examples.
-"""
-
-    resp = client.responses.create(
-        model="gpt-4.1",
-        input=[
-            {"role": "system", "content": "You write clean, structured markdown summaries."},
-            {"role": "user", "content": prompt + "\n\nCHUNK SUMMARIES:\n" + joined},
-        ],
-    )
-    return resp.output_text.strip()
-
-
-def main():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise SystemExit("Missing OPENAI_API_KEY env var.")
-
-    client = OpenAI(api_key=api_key)
-
-    transcript = read_text(TRANSCRIPT_PATH)
-    if not transcript.strip():
-        raise SystemExit(f"Transcript is empty: {TRANSCRIPT_PATH}")
-
-    chunks = split_into_chunks(transcript, MAX_CHARS_PER_CHUNK)
-
-    # Optional: remove timestamps before summarizing
-    cleaned_chunks = [clean_timestamps(c) for c in chunks]
-
-    chunk_summaries = []
-    for i, ch in enumerate(cleaned_chunks, start=1):
-        chunk_summaries.append(summarize_chunk(client, ch, i, len(cleaned_chunks)))
-
-    final_summary = combine_summaries(client, chunk_summaries)
-
-    OUT_SUMMARY_PATH.write_text(final_summary + "\n", encoding="utf-8")
-    print("Wrote:", OUT_SUMMARY_PATH)
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import asyncio
+import functools
+import hashlib
+import math
+import os
+import random
+import shutil
+from dotenv import load_dotenv
+import re
+from pathlib import Path
+from typing import List, Optional
+
+import openai
+import tiktoken
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+ARTIFACTS_DIR = Path("artifacts")
+TRANSCRIPT_PATH = ARTIFACTS_DIR / "transcript.txt"
+OUT_SUMMARY_PATH = ARTIFACTS_DIR / "summary.md"
+SUMMARY_CACHE_DIR = ARTIFACTS_DIR / ".cache" / "summaries"
+PARTIALS_DIR = ARTIFACTS_DIR / "partials"
+
+# Bump when the chunk prompt changes so stale cached summaries are ignored.
+PROMPT_VERSION = "v1"
+
+# Matches the [MM:SS - MM:SS] / [HH:MM:SS - HH:MM:SS] prefixes written by
+# yt_summarize.save_transcript. Compiled once at import.
+_TS_RE = re.compile(r"\[\d{2}:\d{2}(?::\d{2})?\s*-\s*\d{2}:\d{2}(?::\d{2})?\]\s*")
+
+CHUNK_MODEL = "gpt-4.1-mini"
+COMBINE_MODEL = "gpt-4.1"
+
+# Exact token bound per chunk — stable across languages, unlike char counts
+MAX_TOKENS_PER_CHUNK = 2_500
+
+# Above this many chunk summaries, combine via a two-level tree instead of
+# one mega-prompt.
+TREE_COMBINE_THRESHOLD = 12
+
+# Cap on concurrent chunk requests; chunks are I/O-bound network calls,
+# so a handful in flight keeps the pipeline busy without tripping limits.
+MAX_CONCURRENT_REQUESTS = 8
+
+# Defaults sized for a typical paid-tier account; override via --rpm/--tpm.
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+
+MAX_RETRIES = 6
+MAX_BACKOFF_SECONDS = 60
+
+
+class AsyncRateLimiter:
+    """
+    Token-bucket limiter tracking requests-per-minute and tokens-per-minute,
+    modeled on openai-cookbook's api_request_parallel_processor. Callers
+    `await acquire(n_tokens)` before each request; capacity refills
+    continuously based on elapsed time.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last_refill = asyncio.get_event_loop().time()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = asyncio.get_event_loop().time()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, n_tokens: int) -> None:
+        # A request bigger than the whole budget (e.g. a long combine prompt
+        # under a small --tpm) would otherwise wait forever; clamp to capacity
+        # like the cookbook dispatcher and let the API enforce the real limit.
+        n_tokens = min(n_tokens, self.tpm)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= n_tokens:
+                    self._requests -= 1
+                    self._tokens -= n_tokens
+                    return
+                # How long until both buckets have enough capacity?
+                wait = max(
+                    (1 - self._requests) * 60.0 / self.rpm,
+                    (n_tokens - self._tokens) * 60.0 / self.tpm,
+                )
+            await asyncio.sleep(wait)
+
+
+def _cache_path(model: str, chunk_text: str) -> Path:
+    key = hashlib.sha256(f"{model}|{PROMPT_VERSION}|{chunk_text}".encode()).hexdigest()
+    return SUMMARY_CACHE_DIR / f"{key}.txt"
+
+
+def _cache_read(path: Path) -> Optional[str]:
+    if path.exists():
+        return path.read_text(encoding="utf-8")
+    return None
+
+
+def _cache_write(path: Path, text: str) -> None:
+    # Write to a temp file then os.replace so readers never see partial content.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def _create_with_retries(client: AsyncOpenAI, limiter: Optional[AsyncRateLimiter], n_tokens: int, **kwargs):
+    """
+    Issue a responses.create call, charging the rate limiter first and
+    backing off exponentially (with jitter) on rate-limit/timeout errors.
+    """
+    for attempt in range(MAX_RETRIES):
+        if limiter is not None:
+            await limiter.acquire(n_tokens)
+        try:
+            return await client.responses.create(**kwargs)
+        except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError):
+            if attempt == MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(min(2**attempt + random.random(), MAX_BACKOFF_SECONDS))
+
+
+async def _stream_to_file_with_retries(
+    client: AsyncOpenAI,
+    limiter: Optional[AsyncRateLimiter],
+    n_tokens: int,
+    partial_path: Path,
+    **kwargs,
+) -> str:
+    """
+    Streaming variant of _create_with_retries: output-text deltas are flushed
+    to partial_path as they arrive, so progress is visible on disk and a
+    crashed run keeps what was already generated. Same limiter charge and
+    backoff policy; the partial file is rewritten from scratch on retry.
+    """
+    for attempt in range(MAX_RETRIES):
+        if limiter is not None:
+            await limiter.acquire(n_tokens)
+        try:
+            with partial_path.open("w", encoding="utf-8") as f:
+                async with client.responses.stream(**kwargs) as stream:
+                    async for event in stream:
+                        if event.type == "response.output_text.delta":
+                            f.write(event.delta)
+                            f.flush()
+                    resp = await stream.get_final_response()
+            return resp.output_text.strip()
+        except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError):
+            if attempt == MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(min(2**attempt + random.random(), MAX_BACKOFF_SECONDS))
+
+
+def read_text(path: Path) -> str:
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding() -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(CHUNK_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text))
+
+
+def split_into_chunks(text: str, max_tokens: int = MAX_TOKENS_PER_CHUNK) -> List[str]:
+    """
+    Splits transcript into chunks of at most max_tokens tokens (exact, via
+    tiktoken), preferring to break at a newline within the last 10% of each
+    window. Tokenizes once and decodes slices, so there is no repeated
+    re-encoding per chunk.
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    enc = _encoding()
+    ids = enc.encode(text)
+    nl_ids = enc.encode("\n")
+    newline_id = nl_ids[0] if len(nl_ids) == 1 else None
+
+    chunks = []
+    n = len(ids)
+    start = 0
+    while start < n:
+        end = min(start + max_tokens, n)
+        if end < n and newline_id is not None:
+            # Prefer a line boundary near the end of the window.
+            for j in range(end - 1, max(start, end - max_tokens // 10) - 1, -1):
+                if ids[j] == newline_id:
+                    end = j + 1
+                    break
+        chunk = enc.decode(ids[start:end]).strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    return chunks
+
+
+def clean_timestamps(text: str) -> str:
+    """
+    Optional: remove [MM:SS - MM:SS] so the model focuses on content.
+    """
+    return _TS_RE.sub("", text)
+
+
+async def summarize_chunk(
+    client: AsyncOpenAI,
+    chunk_text: str,
+    idx: int,
+    total: Optional[int] = None,
+    limiter: Optional[AsyncRateLimiter] = None,
+    partials_dir: Optional[Path] = None,
+) -> str:
+    # Hashing a chunk costs microseconds; a cache hit skips a multi-second
+    # API call, which makes re-runs after combine-stage tweaks nearly free.
+    cache_path = _cache_path(CHUNK_MODEL, chunk_text)
+    cached = _cache_read(cache_path)
+    if cached is not None:
+        return cached
+
+    # A completed partial from a crashed run also counts as done. Partials
+    # are keyed by the same content digest as the cache, so a .done file can
+    # never be matched against a different chunk's (or video's) text.
+    if partials_dir is not None:
+        done_path = partials_dir / f"{cache_path.stem}.md.done"
+        if done_path.exists():
+            return done_path.read_text(encoding="utf-8").strip()
+
+    # total is unknown when chunks are scheduled while transcription streams.
+    position = f"({idx}/{total})" if total else f"(#{idx})"
+    prompt = f"""
+You are summarizing a transcript chunk {position}.
+Write:
+1) 6-10 bullet key points
+2) important names/terms (if any)
+3) any decisions, steps, or concrete takeaways
+Be faithful to the transcript. If uncertain, say so.
+"""
+
+    request = dict(
+        model=CHUNK_MODEL,
+        input=[
+            {
+                "role": "system",
+                "content": "You produce concise, accurate summaries of transcripts.",
+            },
+            {
+                "role": "user",
+                "content": prompt + "\n\nTRANSCRIPT CHUNK:\n" + chunk_text,
+            },
+        ],
+    )
+
+    if partials_dir is not None:
+        partials_dir.mkdir(parents=True, exist_ok=True)
+        partial_path = partials_dir / f"{cache_path.stem}.md"
+        summary = await _stream_to_file_with_retries(
+            client, limiter, count_tokens(chunk_text), partial_path, **request
+        )
+        os.replace(partial_path, done_path)
+    else:
+        resp = await _create_with_retries(client, limiter, count_tokens(chunk_text), **request)
+        summary = resp.output_text.strip()
+
+    _cache_write(cache_path, summary)
+    return summary
+
+
+async def combine_summaries(
+    client: AsyncOpenAI,
+    chunk_summaries: List[str],
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> str:
+    joined = "\n\n".join(
+        [f"### Chunk {i+1}\n{txt}" for i, txt in enumerate(chunk_summaries)]
+    )
+
+    prompt = """
+You are given summaries of transcript chunks.
+Produce a final structured summary in markdown with:
+
+## Overview (3-5 sentences)
+## Key points (8-12 bullets)
+## Notable details (optional)
+## Action items / next steps (if any)
+## Open questions (if any)
+
+Avoid repeating the same point. Keep it crisp.
+If the content is mostly narrative, focus on themes and examples.
+"""
+
+    resp = await _create_with_retries(
+        client,
+        limiter,
+        count_tokens(joined),
+        model=COMBINE_MODEL,
+        input=[
+            {"role": "system", "content": "You write clean, structured markdown summaries."},
+            {"role": "user", "content": prompt + "\n\nCHUNK SUMMARIES:\n" + joined},
+        ],
+    )
+    return resp.output_text.strip()
+
+
+async def combine_summaries_tree(
+    client: AsyncOpenAI,
+    chunk_summaries: List[str],
+    limiter: Optional[AsyncRateLimiter] = None,
+    fanout: Optional[int] = None,
+) -> str:
+    """
+    Two-level combine for long videos: partition summaries into groups of
+    ~sqrt(k), combine each group concurrently, then combine the group
+    summaries. Each call sees a focused window instead of one mega-prompt;
+    at or below TREE_COMBINE_THRESHOLD this is a single combine call.
+    """
+    k = len(chunk_summaries)
+    if k <= TREE_COMBINE_THRESHOLD:
+        return await combine_summaries(client, chunk_summaries, limiter)
+
+    g = fanout or math.ceil(math.sqrt(k))
+    groups = [chunk_summaries[i : i + g] for i in range(0, k, g)]
+    group_summaries = await asyncio.gather(
+        *[combine_summaries(client, grp, limiter) for grp in groups]
+    )
+    return await combine_summaries(client, list(group_summaries), limiter)
+
+
+def add_summary_args(parser: argparse.ArgumentParser) -> None:
+    """Register summarization flags (shared with main.py)."""
+    parser.add_argument("--rpm", type=int, default=DEFAULT_RPM, help="Requests-per-minute budget")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TPM, help="Tokens-per-minute budget")
+    parser.add_argument(
+        "--fanout",
+        type=int,
+        default=None,
+        help="Group size for hierarchical combining (default: ceil(sqrt(chunks)))",
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Summarize artifacts/transcript.txt with OpenAI.")
+    add_summary_args(parser)
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace):
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("Missing OPENAI_API_KEY env var.")
+
+    client = AsyncOpenAI(api_key=api_key)
+    limiter = AsyncRateLimiter(rpm=args.rpm, tpm=args.tpm)
+
+    transcript = read_text(TRANSCRIPT_PATH)
+    if not transcript.strip():
+        raise SystemExit(f"Transcript is empty: {TRANSCRIPT_PATH}")
+
+    # Strip timestamps in one pass over the whole transcript before chunking,
+    # rather than re-scanning every chunk afterwards.
+    transcript = clean_timestamps(transcript)
+    cleaned_chunks = split_into_chunks(transcript)
+
+    # Chunks are independent, so summarize them concurrently; the semaphore
+    # keeps at most MAX_CONCURRENT_REQUESTS in flight at once.
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def bounded_summarize(chunk_text: str, idx: int) -> str:
+        async with semaphore:
+            return await summarize_chunk(
+                client, chunk_text, idx, len(cleaned_chunks), limiter, partials_dir=PARTIALS_DIR
+            )
+
+    chunk_summaries = await asyncio.gather(
+        *[bounded_summarize(ch, i) for i, ch in enumerate(cleaned_chunks, start=1)]
+    )
+
+    final_summary = await combine_summaries_tree(
+        client, list(chunk_summaries), limiter, fanout=args.fanout
+    )
+
+    OUT_SUMMARY_PATH.write_text(final_summary + "\n", encoding="utf-8")
+    # Partials only need to survive a crash; drop them once the summary lands
+    # so a later run on a different transcript can't resume from stale files.
+    shutil.rmtree(PARTIALS_DIR, ignore_errors=True)
+    print("Wrote:", OUT_SUMMARY_PATH)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -1,23 +1,145 @@
 import argparse
-import subprocess
-import sys
+import asyncio
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, List, Optional
 
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
 
-def run(cmd: list[str]) -> None:
-    result = subprocess.run(cmd)
-    if result.returncode != 0:
-        raise SystemExit(result.returncode)
+import gpt_yt_summarizer as summarizer
+import yt_summarize as yt
 
+load_dotenv()
 
-def main() -> None:
+
+def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Download, transcribe, and summarize a YouTube video.",
     )
-    parser.add_argument("youtube_url", help="YouTube video URL")
-    args = parser.parse_args()
+    parser.add_argument("youtube_urls", nargs="+", help="One or more YouTube video URLs")
+    yt.add_transcription_args(parser)
+    summarizer.add_summary_args(parser)
+    return parser.parse_args()
+
+
+async def summarize_video(
+    youtube_url: str,
+    args: argparse.Namespace,
+    get_model: Callable[[], yt.WhisperModel],
+    use_pool: bool,
+    client: AsyncOpenAI,
+    limiter: summarizer.AsyncRateLimiter,
+    semaphore: asyncio.Semaphore,
+    out_dir: Path,
+    per_video_dirs: bool,
+) -> None:
+    audio_path, title, video_id = yt.download_audio(youtube_url, out_dir, save_wav=args.save_wav)
+
+    # With several URLs, keep each video's outputs in its own subdirectory so
+    # transcripts/summaries don't clobber each other.
+    video_dir = out_dir / yt.sanitize_filename(title) if per_video_dirs else out_dir
+    video_dir.mkdir(parents=True, exist_ok=True)
+
+    # Generator body runs only if the transcript cache misses, so a hit
+    # never loads the model.
+    def fresh_segments():
+        if use_pool:
+            yield from yt.transcribe_parallel(audio_path, args.model_size, args.workers, args.compute_type)
+        else:
+            yield from yt.transcribe_with_timestamps(get_model(), audio_path, batch_size=args.batch_size)
+
+    seg_iter = yt.cached_transcription(video_id, audio_path, fresh_segments())
+
+    partials_dir = video_dir / "partials"
+
+    async def bounded_summarize(chunk_text: str, idx: int) -> str:
+        async with semaphore:
+            return await summarizer.summarize_chunk(
+                client, chunk_text, idx, limiter=limiter, partials_dir=partials_dir
+            )
+
+    tasks: List[asyncio.Task] = []
+    buf: List[str] = []
+    buf_tokens = 0
+
+    def flush_chunk() -> None:
+        nonlocal buf, buf_tokens
+        if buf:
+            tasks.append(asyncio.create_task(bounded_summarize("\n".join(buf), len(tasks) + 1)))
+            buf, buf_tokens = [], 0
+
+    # Pull segments off the blocking Whisper generator on a worker thread so
+    # already-scheduled summarization requests make progress while the rest
+    # of the audio decodes. Each segment is written to the transcript and
+    # bucketed for chapters immediately, so no full segment list is kept.
+    chapter_seconds = 120
+    buckets: dict = {}
+    transcript_path = video_dir / "transcript.txt"
+    with transcript_path.open("w", encoding="utf-8") as f:
+        while True:
+            seg = await asyncio.to_thread(next, seg_iter, None)
+            if seg is None:
+                break
+            f.write(yt.format_transcript_line(seg))
+            yt.bucket_segment(buckets, seg, chapter_seconds)
+            seg_tokens = summarizer.count_tokens(seg["text"])
+            if buf_tokens + seg_tokens > summarizer.MAX_TOKENS_PER_CHUNK:
+                flush_chunk()
+            buf.append(seg["text"])
+            buf_tokens += seg_tokens
+    flush_chunk()
+
+    chapters = yt.chapters_from_buckets(buckets, chapter_seconds)
+    chapters_path = video_dir / "chapters.md"
+    yt.save_chapters(chapters, chapters_path, title, youtube_url)
+
+    chunk_summaries = await asyncio.gather(*tasks)
+    final_summary = await summarizer.combine_summaries_tree(
+        client, list(chunk_summaries), limiter, fanout=args.fanout
+    )
+    summary_path = video_dir / "summary.md"
+    summary_path.write_text(final_summary + "\n", encoding="utf-8")
+    # Partials only need to survive a crash; drop them once the summary lands.
+    shutil.rmtree(partials_dir, ignore_errors=True)
+
+    print("Wrote:")
+    print(" -", transcript_path)
+    print(" -", chapters_path)
+    print(" -", summary_path)
+
+
+async def run_pipeline(args: argparse.Namespace) -> None:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("Missing OPENAI_API_KEY env var.")
 
-    run([sys.executable, "yt_summarize.py", args.youtube_url])
-    run([sys.executable, "gpt_yt_summarizer.py"])
+    client = AsyncOpenAI(api_key=api_key)
+    limiter = summarizer.AsyncRateLimiter(rpm=args.rpm, tpm=args.tpm)
+    semaphore = asyncio.Semaphore(summarizer.MAX_CONCURRENT_REQUESTS)
+
+    out_dir = Path("artifacts")
+    # Load (and warm up) Whisper lazily and only once; the cost amortizes
+    # across all URLs, and a run served entirely from the transcript cache
+    # never pays it. With --workers on CPU the pool builds per-worker models.
+    device, _ = yt.pick_device(args.device, args.compute_type)
+    use_pool = args.workers > 1 and device == "cpu"
+    model: Optional[yt.WhisperModel] = None
+
+    def get_model() -> yt.WhisperModel:
+        nonlocal model
+        if model is None:
+            model = yt.load_model(args.model_size, args.device, args.compute_type)
+        return model
+
+    per_video_dirs = len(args.youtube_urls) > 1
+    for url in args.youtube_urls:
+        await summarize_video(url, args, get_model, use_pool, client, limiter, semaphore, out_dir, per_video_dirs)
+
+
+def main() -> None:
+    asyncio.run(run_pipeline(parse_args()))
 
 
 if __name__ == "__main__":
@@ -1,13 +1,22 @@
+import argparse
+import functools
+import hashlib
 import json
-import math
 import os
 import re
+import string
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from faster_whisper import WhisperModel
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.audio import decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+TRANSCRIPT_CACHE_DIR = Path("artifacts") / ".cache" / "transcripts"
 
 
 def run(cmd: List[str]) -> None:
@@ -17,13 +26,16 @@ def run(cmd: List[str]) -> None:
         raise SystemExit(p.returncode)
 
 
+# Single C-level pass beats re.sub for this fixed character class.
+_SANITIZE_TRANS = str.maketrans({c: "_" for c in '<>:"/\\|?*'})
+
+
 def sanitize_filename(s: str) -> str:
-    s = re.sub(r'[<>:"/\\|?*]+', "_", s)
-    return s.strip()[:120] if s else "video"
+    return (s or "video").translate(_SANITIZE_TRANS).strip()[:120]
 
 
-def format_ts(seconds: float) -> str:
-    seconds = max(0, int(seconds))
+@functools.lru_cache(maxsize=4096)
+def _format_ts_whole(seconds: int) -> str:
     h = seconds // 3600
     m = (seconds % 3600) // 60
     s = seconds % 60
@@ -32,68 +44,144 @@ def format_ts(seconds: float) -> str:
     return f"{m:02d}:{s:02d}"
 
 
-def download_audio(youtube_url: str, out_dir: Path) -> Tuple[Path, str]:
+def format_ts(seconds: float) -> str:
+    # Second-granularity timestamps repeat a lot across segments; cache on
+    # the truncated value so the div/mod/format work runs once per second.
+    return _format_ts_whole(max(0, int(seconds)))
+
+
+def download_audio(youtube_url: str, out_dir: Path, save_wav: bool = False) -> Tuple[Path, str, str]:
     """
-    Downloads best audio and converts to wav for transcription.
-    Returns (wav_path, title).
+    Downloads best audio for transcription and returns (audio_path, title, video_id).
+    faster-whisper decodes and resamples any ffmpeg-readable container
+    internally, so no wav conversion is needed; pass save_wav=True to also
+    keep a 16kHz mono wav copy for debugging.
     """
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    # Get metadata (title)
-    meta_cmd = [sys.executable, "-m", "yt_dlp", "-J", youtube_url]
-    p = subprocess.run(meta_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # One yt-dlp invocation: download and report the final filepath and title
+    # via --print, instead of a metadata pre-fetch plus a glob-and-guess for
+    # whatever extension yt-dlp picked.
+    p = subprocess.run(
+        [
+            sys.executable, "-m", "yt_dlp",
+            "-f", "bestaudio/best",
+            "-o", str(out_dir / "%(title)s.%(ext)s"),
+            "--no-simulate",
+            "--quiet", "--no-warnings",
+            "--print", "after_move:filepath",
+            "--print", "after_move:title",
+            "--print", "after_move:id",
+            youtube_url,
+        ],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
     if p.returncode != 0:
-        print("yt-dlp metadata failed:\n", p.stderr)
+        print("yt-dlp failed:\n", p.stderr)
         raise SystemExit(p.returncode)
-    info = json.loads(p.stdout)
-    title = info.get("title", "video")
-    safe_title = sanitize_filename(title)
-
-    # Download audio to a known filename
-    audio_path = out_dir / f"{safe_title}.m4a"
-    run([
-        sys.executable, "-m", "yt_dlp",
-        "-f", "bestaudio/best",
-        "-o", str(out_dir / f"{safe_title}.%(ext)s"),
-        youtube_url
-    ])
-
-
-    # yt-dlp chooses extension; find the actual downloaded file
-    candidates = list(out_dir.glob(f"{safe_title}.*"))
-    if not candidates:
-        raise FileNotFoundError("No downloaded audio found.")
-    downloaded = max(candidates, key=lambda p: p.stat().st_size)
-
-    # Convert to wav (16k mono) for Whisper
-    wav_path = out_dir / f"{safe_title}.wav"
-    run([
-        "ffmpeg",
-        "-y",
-        "-i", str(downloaded),
-        "-ac", "1",
-        "-ar", "16000",
-        str(wav_path)
-    ])
-
-    return wav_path, title
+    filepath, title, video_id = p.stdout.strip().splitlines()[:3]
+    downloaded = Path(filepath)
+
+    if save_wav:
+        wav_path = downloaded.with_suffix(".wav")
+        run([
+            "ffmpeg",
+            "-y",
+            "-i", str(downloaded),
+            "-ac", "1",
+            "-ar", "16000",
+            # libsoxr beats ffmpeg's default swr resampler on quality at
+            # similar speed
+            "-af", "aresample=resampler=soxr:precision=28",
+            str(wav_path)
+        ])
+
+    return downloaded, title, video_id
+
+
+def pick_device(device: str = "auto", compute_type: str = "auto") -> Tuple[str, str]:
+    """
+    Resolve "auto" to cuda/float16 when a GPU is present, else cpu/int8.
+    fp16 on Tensor Cores takes Whisper-small to 15-20x realtime; int8 is
+    the fastest practical CPU config.
+    """
+    if device == "auto":
+        try:
+            import torch
 
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        except ImportError:
+            device = "cpu"
+    if compute_type == "auto":
+        compute_type = "float16" if device == "cuda" else "int8"
+    return device, compute_type
 
-def transcribe_with_timestamps(
-    wav_path: Path,
+
+def load_model(
     model_size: str = "small",
     device: str = "auto",
     compute_type: str = "auto",
-) -> List[Dict]:
+) -> WhisperModel:
     """
-    Returns a list of segments: {start, end, text}
+    Build a WhisperModel once and prime its kernels on a second of silence,
+    so the first real segment doesn't pay the JIT/warmup cost. Construction
+    loads hundreds of MB of weights — reuse the returned model across calls.
     """
+    device, compute_type = pick_device(device, compute_type)
     model = WhisperModel(model_size, device=device, compute_type=compute_type)
-    segments, info = model.transcribe(
-        str(wav_path),
+    segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), vad_filter=False)
+    for _ in segments:  # transcribe is lazy; drain to actually run the warmup
+        pass
+    return model
+
+
+def transcribe_with_timestamps(
+    model: WhisperModel,
+    audio_path: Path,
+    batch_size: int = 8,
+) -> Iterator[Dict]:
+    """
+    Yields segments {start, end, text} as transcription progresses.
+    faster-whisper's transcribe is lazy, so segments stream out while the
+    rest of the audio is still decoding — callers can overlap downstream
+    work (e.g. summarization) with transcription.
+    """
+    # Batch VAD-detected speech chunks through the encoder instead of
+    # decoding them one at a time — 3-4x faster than sequential transcribe.
+    batched = BatchedInferencePipeline(model=model)
+    segments, info = batched.transcribe(
+        str(audio_path),
+        batch_size=batch_size,
         vad_filter=True,
         word_timestamps=False,  # segment-level timestamps are enough for chapters
     )
+    for seg in segments:
+        text = (seg.text or "").strip()
+        if text:
+            yield {"start": float(seg.start), "end": float(seg.end), "text": text}
+
+
+# Per-worker model, built once by the pool initializer (WhisperModel can't be
+# pickled, so each process constructs its own).
+_WORKER_MODEL = None
+
+
+def _worker_init(model_size: str, compute_type: str) -> None:
+    global _WORKER_MODEL
+    # cpu_threads=2 per worker avoids oversubscribing cores across the pool.
+    _WORKER_MODEL = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=2)
+
+
+def _transcribe_regions(audio_path: str, clip_timestamps: str) -> List[Dict]:
+    # VAD already ran in the parent; clip_timestamps carries its speech
+    # regions. transcribe ignores vad_filter whenever clip_timestamps is set,
+    # so it must stay off here.
+    segments, _ = _WORKER_MODEL.transcribe(
+        audio_path,
+        clip_timestamps=clip_timestamps,
+        vad_filter=False,
+        word_timestamps=False,
+    )
     out = []
     for seg in segments:
         text = (seg.text or "").strip()
@@ -102,36 +190,133 @@ def transcribe_with_timestamps(
     return out
 
 
-def make_chapters(
-    segments: List[Dict],
-    chapter_seconds: int = 120,
-    min_chars: int = 200,
-) -> List[Tuple[int, str]]:
+def transcribe_parallel(
+    audio_path: Path,
+    model_size: str = "small",
+    workers: int = 2,
+    compute_type: str = "auto",
+) -> Iterator[Dict]:
     """
-    Simple timestamp chaptering:
-    - bucket transcript into fixed time windows (default 2 minutes)
-    - use first meaningful line as chapter title
+    CPU-only alternative to transcribe_with_timestamps: run Silero VAD once
+    over the full audio, partition the speech regions into groups balanced by
+    speech duration, and transcribe each group on a process pool, one model
+    per worker. Near-linear speedup to ~4 workers; beyond that memory
+    bandwidth dominates. Groups are contiguous in time, so yielding them in
+    submission order keeps segments sorted by start.
     """
-    if not segments:
-        return []
+    _, compute_type = pick_device("cpu", compute_type)
+
+    audio = decode_audio(str(audio_path), sampling_rate=16000)
+    speech = get_speech_timestamps(audio, VadOptions())
+    if not speech:
+        return
+    regions = [(t["start"] / 16000.0, t["end"] / 16000.0) for t in speech]
+
+    # Greedily split regions into contiguous groups of roughly equal total
+    # speech time so no worker gets stuck with the talkative half.
+    total_speech = sum(e - s for s, e in regions)
+    target = total_speech / workers
+    groups: List[List[Tuple[float, float]]] = [[]]
+    acc = 0.0
+    for s, e in regions:
+        if acc >= target and len(groups) < workers:
+            groups.append([])
+            acc = 0.0
+        groups[-1].append((s, e))
+        acc += e - s
+
+    with ProcessPoolExecutor(
+        max_workers=len(groups),
+        initializer=_worker_init,
+        initargs=(model_size, compute_type),
+    ) as ex:
+        futures = [
+            ex.submit(
+                _transcribe_regions,
+                str(audio_path),
+                ",".join(f"{s:.3f},{e:.3f}" for s, e in group),
+            )
+            for group in groups
+        ]
+        for fut in futures:
+            yield from fut.result()
+
+
+def audio_fingerprint(audio_path: Path) -> str:
+    """
+    Cheap content hash: sha256 over file size plus the first and last 1MB.
+    Enough to tell whether a cached transcript still matches the audio
+    without reading multi-GB files end to end.
+    """
+    size = audio_path.stat().st_size
+    h = hashlib.sha256(str(size).encode())
+    one_mb = 1024 * 1024
+    with audio_path.open("rb") as f:
+        h.update(f.read(one_mb))
+        if size > 2 * one_mb:
+            f.seek(-one_mb, os.SEEK_END)
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _load_cached_segments(video_id: str, audio_sha: str) -> Optional[List[Dict]]:
+    path = TRANSCRIPT_CACHE_DIR / f"{video_id}.json"
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if data.get("audio_sha") != audio_sha:
+        return None
+    return data.get("segments")
+
+
+def _store_cached_segments(video_id: str, audio_sha: str, segments: List[Dict]) -> None:
+    TRANSCRIPT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = TRANSCRIPT_CACHE_DIR / f"{video_id}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"audio_sha": audio_sha, "segments": segments}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def cached_transcription(video_id: str, audio_path: Path, seg_iter: Iterator[Dict]) -> Iterator[Dict]:
+    """
+    Yield cached segments for this video id when the stored audio fingerprint
+    still matches, skipping Whisper entirely; otherwise drain seg_iter (which
+    is lazy, so a cache hit never touches the model) and store the result.
+    """
+    audio_sha = audio_fingerprint(audio_path)
+    cached = _load_cached_segments(video_id, audio_sha)
+    if cached is not None:
+        yield from cached
+        return
 
-    total_end = int(max(s["end"] for s in segments))
-    n = math.ceil(total_end / chapter_seconds)
+    collected = []
+    for seg in seg_iter:
+        collected.append(seg)
+        yield seg
+    _store_cached_segments(video_id, audio_sha, collected)
 
-    chapters = []
-    seg_idx = 0
 
-    for i in range(n):
-        start_t = i * chapter_seconds
-        end_t = (i + 1) * chapter_seconds
+def bucket_segment(buckets: Dict[int, List[str]], seg: Dict, chapter_seconds: int) -> None:
+    """Append a segment's text to its fixed-time-window chapter bucket."""
+    buckets.setdefault(int(seg["start"]) // chapter_seconds, []).append(seg["text"])
 
-        bucket = []
-        while seg_idx < len(segments) and segments[seg_idx]["start"] < end_t:
-            if segments[seg_idx]["end"] > start_t:
-                bucket.append(segments[seg_idx]["text"])
-            seg_idx += 1
 
-        text = " ".join(bucket).strip()
+def chapters_from_buckets(
+    buckets: Dict[int, List[str]],
+    chapter_seconds: int = 120,
+    min_chars: int = 200,
+) -> List[Tuple[int, str]]:
+    """
+    Turn per-window text buckets into (start_seconds, title) chapters:
+    - skip windows with too little text
+    - use first sentence-ish chunk as the chapter title
+    """
+    chapters = []
+    for b in sorted(buckets):
+        text = " ".join(buckets[b]).strip()
         if len(text) < min_chars:
             continue
 
@@ -141,13 +326,14 @@ def make_chapters(
         if not title:
             title = "Section"
 
-        chapters.append((start_t, title))
+        chapters.append((b * chapter_seconds, title))
 
-    # de-dup titles
+    # De-dup titles on their first-4-word shingle (lowercased, punctuation
+    # stripped) so near-dupes like "Key takeaways" / "Key takeaways." collapse.
     deduped = []
-    seen = set()
+    seen: set = set()
     for ts, title in chapters:
-        key = title.lower()
+        key = tuple(w.strip(string.punctuation) for w in title.lower().split()[:4])
         if key in seen:
             continue
         seen.add(key)
@@ -155,10 +341,37 @@ def make_chapters(
     return deduped
 
 
+def make_chapters(
+    segments: List[Dict],
+    chapter_seconds: int = 120,
+    min_chars: int = 200,
+) -> List[Tuple[int, str]]:
+    """
+    Simple timestamp chaptering over an already-materialized segment list:
+    bucket into fixed time windows (default 2 minutes), then title each bucket.
+    Bucket assignment runs as one vectorized searchsorted instead of
+    per-segment Python comparisons.
+    """
+    if not segments:
+        return []
+
+    starts = np.fromiter((s["start"] for s in segments), dtype=np.float32, count=len(segments))
+    bucket_edges = np.arange(0, float(starts.max()) + chapter_seconds, chapter_seconds, dtype=np.float32)
+    bucket_idx = np.searchsorted(bucket_edges, starts, side="right") - 1
+
+    buckets: Dict[int, List[str]] = {}
+    for b in np.unique(bucket_idx):
+        buckets[int(b)] = [segments[i]["text"] for i in np.nonzero(bucket_idx == b)[0]]
+    return chapters_from_buckets(buckets, chapter_seconds, min_chars)
+
+
+def format_transcript_line(seg: Dict) -> str:
+    return f"[{format_ts(seg['start'])} - {format_ts(seg['end'])}] {seg['text']}\n"
+
+
 def save_transcript(segments: List[Dict], out_path: Path) -> None:
-    with out_path.open("w", encoding="utf-8") as f:
-        for s in segments:
-            f.write(f"[{format_ts(s['start'])} - {format_ts(s['end'])}] {s['text']}\n")
+    # One join + one write instead of a Python-level write per segment.
+    out_path.write_text("".join(map(format_transcript_line, segments)), encoding="utf-8")
 
 
 def save_chapters(chapters: List[Tuple[int, str]], out_path: Path, video_title: str, youtube_url: str) -> None:
@@ -170,28 +383,82 @@ def save_chapters(chapters: List[Tuple[int, str]], out_path: Path, video_title:
             f.write(f"- {format_ts(ts)} — {title}\n")
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: uv run python yt_summarize.py <YOUTUBE_URL>")
-        raise SystemExit(2)
+def add_transcription_args(parser: argparse.ArgumentParser) -> None:
+    """Register download/transcription flags (shared with main.py)."""
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Speech chunks per Whisper batch; keep small (2-4) on CPU, 8-16 on GPU",
+    )
+    parser.add_argument(
+        "--model-size",
+        default="small",
+        help='Whisper model size; "small" fp16 fits in 6GB VRAM, pick "medium" only with headroom',
+    )
+    parser.add_argument(
+        "--device",
+        default="auto",
+        help='"cuda", "cpu", or "auto" to use the GPU when available',
+    )
+    parser.add_argument(
+        "--compute-type",
+        default="auto",
+        help='CTranslate2 compute type; "auto" picks float16 on GPU, int8 on CPU (int8_float16 also works well on GPU)',
+    )
+    parser.add_argument(
+        "--save-wav",
+        action="store_true",
+        help="Also keep a 16kHz mono wav copy of the audio for debugging",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="CPU-only: transcribe equal-duration audio regions on this many worker processes",
+    )
 
-    youtube_url = sys.argv[1]
-    out_dir = Path("artifacts")
-    wav_path, title = download_audio(youtube_url, out_dir)
-
-    # For your RTX 3060 6GB, "small" or "medium" is the sweet spot.
-    segments = transcribe_with_timestamps(
-    wav_path,
-    model_size="small",
-    device="cpu",
-    compute_type="int8"
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Download and transcribe a YouTube video with timestamped chapters.",
     )
+    parser.add_argument("youtube_url", help="YouTube video URL")
+    add_transcription_args(parser)
+    return parser.parse_args()
+
 
+def main():
+    args = parse_args()
 
+    youtube_url = args.youtube_url
+    out_dir = Path("artifacts")
+    audio_path, title, video_id = download_audio(youtube_url, out_dir, save_wav=args.save_wav)
+
+    # Generator body runs only if the transcript cache misses, so a hit
+    # never loads the model.
+    def fresh_segments() -> Iterator[Dict]:
+        device, _ = pick_device(args.device, args.compute_type)
+        if args.workers > 1 and device == "cpu":
+            yield from transcribe_parallel(audio_path, args.model_size, args.workers, args.compute_type)
+        else:
+            model = load_model(args.model_size, args.device, args.compute_type)
+            yield from transcribe_with_timestamps(model, audio_path, batch_size=args.batch_size)
+
+    segments = cached_transcription(video_id, audio_path, fresh_segments())
+
+    # Single pass over the segment stream: write each transcript line as it
+    # arrives and accumulate chapter buckets, instead of materializing the
+    # whole segment list in memory.
+    chapter_seconds = 120
+    buckets: Dict[int, List[str]] = {}
     transcript_path = out_dir / "transcript.txt"
-    save_transcript(segments, transcript_path)
+    with transcript_path.open("w", encoding="utf-8") as f:
+        for seg in segments:
+            f.write(format_transcript_line(seg))
+            bucket_segment(buckets, seg, chapter_seconds)
 
-    chapters = make_chapters(segments, chapter_seconds=120)
+    chapters = chapters_from_buckets(buckets, chapter_seconds)
     chapters_path = out_dir / "chapters.md"
     save_chapters(chapters, chapters_path, title, youtube_url)
 